@@ -11,11 +11,10 @@
 #
 
 import shutil
-import re
 import os
 from gettext import gettext as _
 
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib
 
 from sensors import SensorManager
 from sensors import ISMError
@@ -107,6 +106,7 @@ class SensorsListModel(object):
     def _on_edit_sensor(self, evnt=None, blank=True):
         """Raises a dialog with a form to add/edit a sensor"""
         name = desc = cmd = ""
+        persistent = False
         tree_iter = None
         if not blank:
             # edit, so get the info from the selected row
@@ -117,6 +117,7 @@ class SensorsListModel(object):
             name = self._list_store.get_value(tree_iter, 0)
             desc = self._list_store.get_value(tree_iter, 1)
             cmd = self.sensor_mgr.get_command(name)
+            persistent = self.sensor_mgr.is_persistent(name)
 
             if cmd is True:  # default sensor
                 raise_dialog(
@@ -155,7 +156,12 @@ class SensorsListModel(object):
         cmd_entry.set_text(cmd)
         hbox.pack_start(label, False, False, 0)
         hbox.pack_end(cmd_entry, False, False, 1)
-        vbox.pack_end(hbox, False, False, 2)
+        vbox.pack_start(hbox, False, False, 2)
+
+        persistent_check = Gtk.CheckButton(
+            _("Keep running, one value per output line"))
+        persistent_check.set_active(persistent)
+        vbox.pack_end(persistent_check, False, False, 3)
 
         dialog.show_all()
         response = dialog.run()
@@ -164,11 +170,12 @@ class SensorsListModel(object):
             try:
                 newname, desc, cmd = str(sensor_entry.get_text()), \
                                      str(desc_entry.get_text()), str(cmd_entry.get_text())
+                persistent = persistent_check.get_active()
 
                 if blank:
-                    self.sensor_mgr.add(newname, desc, cmd)
+                    self.sensor_mgr.add(newname, desc, cmd, persistent)
                 else:
-                    self.sensor_mgr.edit(name, newname, desc, cmd)
+                    self.sensor_mgr.edit(name, newname, desc, cmd, persistent)
                     self._list_store.remove(tree_iter)
 
                 self._list_store.append([newname, desc])
@@ -217,7 +224,7 @@ class Preferences(Gtk.Dialog):
     AUTOSTART_PATH = '{}/.config/autostart/indicator-sysmonitor.desktop' \
         .format(os.getenv("HOME"))
     DESKTOP_PATH = '/usr/share/applications/indicator-sysmonitor.desktop'
-    sensors_regex = re.compile("{.+?}")
+    PREVIEW_INTERVAL = 500  # ms
 
     def __init__(self, parent):
         """It creates the widget of the dialogs"""
@@ -225,10 +232,16 @@ class Preferences(Gtk.Dialog):
         self.ind_parent = parent
         self.custom_entry = None
         self.interval_entry = None
+        self.preview_label = None
         self.sensor_mgr = SensorManager()
         self._create_content()
         self.set_data()
         self.show_all()
+        self._preview_text = self.custom_entry.get_text()
+        self._update_preview()
+        self._preview_id = GLib.timeout_add(Preferences.PREVIEW_INTERVAL,
+                                            self._update_preview)
+        self.connect('destroy', self._on_destroy)
 
     def _create_content(self):
         """It creates the content for this dialog."""
@@ -246,6 +259,7 @@ class Preferences(Gtk.Dialog):
         version_label.set_label(_('This is indicator-sysmonitor version: {}').format(VERSION))
         self.custom_entry = ui.get_object('custom_entry')
         self.interval_entry = ui.get_object('interval_entry')
+        self.preview_label = ui.get_object('preview_label')
 
         sensors_list = SensorsListModel(self)
         vbox = ui.get_object('advanced_box')
@@ -305,15 +319,11 @@ class Preferences(Gtk.Dialog):
         It does NOT update the config file."""
         custom_text = self.custom_entry.get_text()
 
-        # check if the sensors are supported
-        sensors = Preferences.sensors_regex.findall(custom_text)
-        for sensor in sensors:
-            sensor = sensor[1:-1]
-            if not self.sensor_mgr.exists(sensor):
-                raise ISMError(_("{{{}}} sensor not supported.").
-                               format(sensor))
-            # Check if the sensor is well-formed
-            self.sensor_mgr.check(sensor)
+        # check if the sensors are supported and well-formed
+        for sensor in self.sensor_mgr.get_sensor_names(custom_text):
+            self.sensor_mgr.validate(sensor, recheck=True)
+        # and if their format specs suit them
+        self.sensor_mgr.check_template(custom_text)
 
         try:
             interval = float(self.interval_entry.get_text())
@@ -330,6 +340,32 @@ class Preferences(Gtk.Dialog):
         # TODO: on_startup
         self.ind_parent.update_indicator_guide()
 
+    def _update_preview(self):
+        """Shows the label being edited with the latest values of the
+        fetcher. It never samples nor checks the sensors itself, and
+        waits for the text to stay the same for a while, so that the
+        tokens being typed are not checked."""
+        custom_text = self.custom_entry.get_text()
+        if custom_text != self._preview_text:
+            self._preview_text = custom_text
+            return True
+
+        try:
+            for sensor in self.sensor_mgr.get_sensor_names(custom_text):
+                self.sensor_mgr.validate(sensor, wait=False)
+            preview = self.sensor_mgr.preview(custom_text)
+        except ISMError as ex:
+            preview = str(ex)
+        except (ValueError, TypeError) as ex:
+            preview = _("Invalid format: {}").format(ex)
+
+        self.preview_label.set_text(_("Preview: {}").format(preview))
+        return True
+
+    def _on_destroy(self, widget=None):
+        GLib.source_remove(self._preview_id)
+        self.sensor_mgr.stop_preview()
+
     def set_data(self):
         """It sets the widgets with the config data."""
         self.custom_entry.set_text(self.sensor_mgr.get_custom_text())
@@ -12,16 +12,33 @@
 
 import json
 import time
-from threading import Thread
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http.client
+import urllib.parse
 import subprocess
 import copy
 import logging
 import re
 import os
+import signal
+import selectors
+import string
+import importlib.util
+from importlib import metadata
 from gettext import gettext as _
 
 import psutil as ps
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 B_UNITS = ['', 'KB', 'MB', 'GB', 'TB']
 
@@ -34,6 +51,41 @@ def bytes_to_human(bytes_):
     return '{}{}'.format(int(bytes_), B_UNITS[unit])
 
 
+def size_to_human(bytes_):
+    for unit in B_UNITS:
+        if bytes_ < 1024:
+            return "{} {}".format(round(bytes_, 2), unit)
+        bytes_ /= 1024
+
+    return "{} {}".format(round(bytes_ * 1024, 2), B_UNITS[-1])
+
+
+def _render_rates(rates, spec=None):
+    if not isinstance(rates, tuple):
+        return bytes_to_human(rates) + '/s' if spec is None else format(rates, spec)
+
+    down, up = rates
+    if spec is None:
+        return '↓{}/s ↑{}/s'.format(bytes_to_human(down), bytes_to_human(up))
+
+    return '↓{} ↑{}'.format(format(down, spec), format(up, spec))
+
+
+# how a sample is shown when the template gives no format spec
+RENDERERS = {
+    '%': '{:02.0f}%'.format,
+    'B': size_to_human,
+    'B/s': _render_rates,
+}
+
+# the widest value of each unit, used for the label guide
+WIDEST_VALUES = {
+    '%': 100,
+    'B': 1023.99 * 1024 ** 3,
+    'B/s': 1023 * 1024,
+}
+
+
 class ISMError(Exception):
     """General exception."""
 
@@ -41,11 +93,97 @@ class ISMError(Exception):
         Exception.__init__(self, msg)
 
 
+class Sample(object):
+    """A typed value read from a sensor. It is only turned into text
+    when the label is rendered, using the format spec given in the
+    template ({cpu:3.0f}) or the default one for its unit ({cpu} or
+    {cpu:auto})."""
+    __slots__ = ('value', 'unit', 'timestamp', 'stale')
+
+    def __init__(self, value, unit='', timestamp=None):
+        self.value = value
+        self.unit = unit
+        self.timestamp = time.time() if timestamp is None else timestamp
+        # set when the value could not be refreshed, it is shown with a '?'
+        self.stale = False
+
+    def __format__(self, spec):
+        text = self._format(spec)
+        return text + '?' if self.stale else text
+
+    def _format(self, spec):
+        value = self.value
+        if isinstance(value, str):
+            if spec in ('', 'auto'):
+                return value
+            try:
+                value = float(value)
+            except ValueError:
+                # e.g. N/A or (no output), whatever the spec
+                return value
+
+        if spec in ('', 'auto'):
+            renderer = RENDERERS.get(self.unit)
+            return renderer(value) if renderer else str(value)
+
+        if isinstance(value, tuple):
+            return RENDERERS[self.unit](value, spec)
+
+        return format(value, spec)
+
+    def __str__(self):
+        return format(self)
+
+    def __repr__(self):
+        return 'Sample({!r}, {!r})'.format(self.value, self.unit)
+
+    def to_dict(self):
+        return {'value': self.value, 'unit': self.unit,
+                'timestamp': self.timestamp, 'stale': self.stale}
+
+    @staticmethod
+    def from_dict(data):
+        value = data['value']
+        # tuples come back from json as lists
+        if isinstance(value, list):
+            value = tuple(value)
+        if 'cores' in data:
+            cores = np.array(data['cores'], dtype=float) if np is not None \
+                else data['cores']
+            sample = CoresSample(value, cores, data['default'], data.get('timestamp'))
+        else:
+            sample = Sample(value, data.get('unit', ''), data.get('timestamp'))
+        sample.stale = data.get('stale', False)
+
+        return sample
+
+    def widest(self):
+        """Returns a sample as wide as this one can get once rendered."""
+        if self.unit in WIDEST_VALUES:
+            value = WIDEST_VALUES[self.unit]
+            if isinstance(self.value, tuple):
+                value = (value,) * len(self.value)
+            return Sample(value, self.unit, self.timestamp)
+
+        return self
+
+
 class SensorManager(object):
     """Singleton"""
     _instance = None
 
     SETTINGS_FILE = os.getenv("HOME") + '/.indicator-sysmonitor.json'
+    PLUGINS_DIR = os.getenv("HOME") + '/.indicator-sysmonitor/plugins'
+    PLUGINS_GROUP = 'indicator_sysmonitor.sensors'
+    CAPTURE_DIR = os.getenv("HOME") + '/.cache/indicator-sysmonitor'
+    SNAPSHOT_PORT = 8085
+    # sensors only asked for by remote hosts stop being sampled after this
+    WATCH_TIMEOUT = 300
+    # and at most that many of them are sampled
+    MAX_WATCHED = 32
+    # a sensor which failed its check is checked again after this, as
+    # a mount point or a unit it names may show up meanwhile
+    CHECK_RETRY = 5
     digit_regex = re.compile(r'''\d+''')
 
     class __impl:
@@ -56,10 +194,28 @@ class SensorManager(object):
         'on_startup': False,
         'sensors': {
             # 'name' => (desc, cmd)
-            }
+            },
+        # names of the custom sensors whose command is kept running
+        'persistent': [],
+        # 'address:port' where the snapshot of the sensors is served
+        'snapshot_listen': None,
+        # 'host' => 'address:port', for the remote//host/sensor sensors
+        'remotes': {},
+        # e.g. {'sensor': 'cpu', 'above': 90, 'ticks': 3, 'below': 80}, see
+        # ThresholdRule
+        'rules': [],
+        # when a rule trips, sensors are sampled every burst_interval seconds
+        # for burst_duration seconds and saved to a file in CAPTURE_DIR
+        'burst_interval': 0.25,
+        'burst_duration': 10,
+        'capture_processes': True,
+        # sample in a separate process, see SamplerProcess
+        'sampler_process': False
         }
 
         supported_sensors = None
+        _template = (None, [])
+        _checks = {}  # sensor => (error message or None, time)
 
 
         def __init__(self):
@@ -68,16 +224,31 @@ class SensorManager(object):
                                      NetSensor(),
                                      BatSensor(),
                                      FSSensor(),
-                                     SwapSensor()]
-
-            for sensor in self.sensor_instances:
-                self.settings['sensors'][sensor.name] = (sensor.desc, sensor.cmd)
+                                     SwapSensor(),
+                                     CGroupSensor(),
+                                     PSISensor(),
+                                     RemoteSensor()]
+            self.load_plugins()
+            self._register_sensors()
 
             #self.update_regex()
 
             self.last = ps.cpu_times()
             self._last_net_usage = [0, 0]  # (up, down)
 
+            self._selector = selectors.DefaultSelector()
+            self._streams = {}
+            self._streams_lock = Lock()
+
+            self._fetcher = None
+            self._prepared = []  # the sensors used by the previous tick
+            self._latest = {}
+            self._watched = {}  # sensor => last time a remote host asked for it
+            self._watched_lock = Lock()
+            self._previewed = {}  # sensor => last time the preview asked for it
+            self._checking = set()  # sensors being checked in the background
+            self._server = None
+
         #@staticmethod
         @classmethod
         def update_regex(self, names=None):
@@ -88,6 +259,61 @@ class SensorManager(object):
             reg = "\A({})\Z".format(reg)
             #global supported_sensors
             self.supported_sensors = re.compile("{}".format(reg))
+            self._checks = {}
+
+        def _register_sensors(self):
+            for sensor in self.sensor_instances:
+                self.settings['sensors'][sensor.name] = (sensor.desc, sensor.cmd)
+
+        def load_plugins(self):
+            """Loads the sensors defined by the plugins found in the
+            plugins directory or registered as entry points."""
+            classes = []
+            if os.path.isdir(SensorManager.PLUGINS_DIR):
+                for filename in sorted(os.listdir(SensorManager.PLUGINS_DIR)):
+                    if filename.endswith('.py'):
+                        classes.extend(self._load_plugin_file(
+                            os.path.join(SensorManager.PLUGINS_DIR, filename)))
+
+            try:
+                entry_points = metadata.entry_points(group=SensorManager.PLUGINS_GROUP)
+            except TypeError:  # python < 3.10
+                entry_points = metadata.entry_points().get(SensorManager.PLUGINS_GROUP, [])
+            for entry_point in entry_points:
+                try:
+                    classes.append(entry_point.load())
+                except Exception as ex:
+                    logging.exception(ex)
+                    logging.error(_("Loading plugin {} failed").format(entry_point.name))
+
+            names = [sensor.name for sensor in self.sensor_instances]
+            for cls in classes:
+                if cls.name in names:
+                    logging.error(_("Plugin sensor name already in use: {}").format(cls.name))
+                    continue
+                try:
+                    self.sensor_instances.append(PluginSensor(cls()))
+                    names.append(cls.name)
+                    logging.info(_("Plugin sensor loaded: {}").format(cls.name))
+                except Exception as ex:
+                    logging.exception(ex)
+                    logging.error(_("Loading plugin {} failed").format(cls.name))
+
+        def _load_plugin_file(self, path):
+            """Returns the sensors defined in a plugin file."""
+            module_name = 'ism_plugin_' + os.path.splitext(os.path.basename(path))[0]
+            try:
+                spec = importlib.util.spec_from_file_location(module_name, path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            except Exception as ex:
+                logging.exception(ex)
+                logging.error(_("Loading plugin {} failed").format(path))
+                return []
+
+            return [value for value in vars(module).values()
+                    if isinstance(value, type) and issubclass(value, BaseSensor)
+                    and value.__module__ == module_name and value.name]
 
         def get(self, name):
             """
@@ -111,12 +337,62 @@ class SensorManager(object):
             for sensor in self.sensor_instances:
                 sensor.check(sensor_string)
 
-        def add(self, name, desc, cmd):
+        def validate(self, name, recheck=False, wait=True):
+            """Raises an ISMError if a sensor of the label is not supported
+            or malformed. Successes are cached until the sensors change,
+            failures for CHECK_RETRY seconds, or not at all with recheck.
+            Unless wait is set, a sensor not checked yet is checked in the
+            background and reported as being checked meanwhile."""
+            error, checked = self._checks.get(name, (None, None))
+            if checked is None or error is not None and \
+                    (recheck or time.time() - checked > SensorManager.CHECK_RETRY):
+                if not wait:
+                    self._check_later(name)
+                    raise ISMError(_("Checking {{{}}}…").format(name))
+                error = self._check(name)
+
+            if error is not None:
+                raise ISMError(error)
+
+        def _check(self, name):
+            error = None
+            if not self.exists(name):
+                error = _("{{{}}} sensor not supported.").format(name)
+            else:
+                try:
+                    self.check(name)
+                except ISMError as ex:
+                    error = str(ex)
+
+            now = time.time()
+            # forget the failures of the tokens typed on the way
+            for other, (other_error, checked) in list(self._checks.items()):
+                if other_error is not None and \
+                        now - checked > SensorManager.CHECK_RETRY:
+                    del self._checks[other]
+            self._checks[name] = (error, now)
+            return error
+
+        def _check_later(self, name):
+            if name in self._checking:
+                return
+            self._checking.add(name)
+
+            def check():
+                try:
+                    self._check(name)
+                finally:
+                    self._checking.discard(name)
+
+            Thread(target=check, daemon=True).start()
+
+        def add(self, name, desc, cmd, persistent=False):
             """Adds a custom sensors."""
-            if SensorManager.exists(name):
+            if self.exists(name):
                 raise ISMError(_("Sensor name already in use."))
 
             self.settings["sensors"][name] = (desc, cmd)
+            self._set_persistent(name, persistent)
             self.update_regex()
 
         def delete(self, name):
@@ -131,9 +407,11 @@ class SensorManager(object):
                 raise ISMError(_("Can not delete default sensors."))
 
             del sensors[name]
+            self._set_persistent(name, False)
+            self._stop_stream(name)
             self.update_regex()
 
-        def edit(self, name, newname, desc, cmd):
+        def edit(self, name, newname, desc, cmd, persistent=False):
             """Edits a custom sensors."""
             try:
                 sensors = self.settings['sensors']
@@ -150,6 +428,9 @@ class SensorManager(object):
 
             sensors[newname] = (desc, cmd)
             del sensors[name]
+            self._set_persistent(name, False)
+            self._set_persistent(newname, persistent)
+            self._stop_stream(name)
             self.settings["custom_text"] = self.settings["custom_text"].replace(
                 name, newname)
             self.update_regex()
@@ -168,7 +449,18 @@ class SensorManager(object):
                 if cfg['on_startup'] is not None:
                     self.settings['on_startup'] = cfg['on_startup']
                 if cfg['sensors'] is not None:
-                    self.settings['sensors'] = cfg['sensors']
+                    # only the custom sensors, older versions saved the others
+                    # too, including plugins which may be uninstalled since
+                    self.settings['sensors'] = {
+                        name: sensor for name, sensor in cfg['sensors'].items()
+                        if sensor[1] is not True}
+                    self._register_sensors()
+                # missing from config files written by older versions
+                for key in ('persistent', 'snapshot_listen', 'remotes', 'rules',
+                            'burst_interval', 'burst_duration',
+                            'capture_processes', 'sampler_process'):
+                    if cfg.get(key) is not None:
+                        self.settings[key] = cfg[key]
 
                 self.update_regex()
 
@@ -180,36 +472,110 @@ class SensorManager(object):
             """It stores the current settings to the config file."""
             # TODO: use gsettings
             try:
+                settings = dict(self.settings)
+                # the built-in and plugin sensors are registered on start
+                settings['sensors'] = {
+                    name: sensor for name, sensor in self.settings['sensors'].items()
+                    if sensor[1] is not True}
                 with open(SensorManager.SETTINGS_FILE, 'w') as f:
-                    f.write(json.dumps(self.settings))
+                    f.write(json.dumps(settings))
 
             except Exception as ex:
                 logging.exception(ex)
                 logging.error('Writing settings failed')
 
-        def get_guide(self):
-            """Updates the label guide from appindicator."""
-
-            # foss - I'm doubtful any of this guide stuff works - this needs to be recoded
-            # each sensor needs a sensor guide
-            data = self._fetcher.fetch()
-
-            for key in data:
-                if key.startswith('fs'):
-                    data[key] = '000gB'
-                    break
-
-            data['mem'] = data['cpu'] = data['bat'] = '000%'
-            data['net'] = '↓666kB/s ↑666kB/s'
+        @staticmethod
+        def parse_template(text):
+            """Splits a label template into (literal, sensor, format spec)
+            parts. The sensor is None for the trailing literal."""
+            try:
+                return [(literal, name, spec)
+                        for literal, name, spec, _conversion
+                        in string.Formatter().parse(text)]
+            except ValueError as ex:
+                raise ISMError(_("Invalid label: {}").format(ex))
+
+        def get_sensor_names(self, text=None):
+            """Returns the sensors used by a template, the current one by
+            default, in order and without duplicates."""
+            parts = self._get_template() if text is None \
+                else self.parse_template(text)
+            names = []
+            for _literal, name, _spec in parts:
+                if name and name not in names:
+                    names.append(name)
+
+            return names
+
+        def _get_template(self):
+            """The parsed custom text, cached until it changes."""
+            text = self.settings["custom_text"]
+            if self._template[0] != text:
+                self._template = (text, self.parse_template(text))
+
+            return self._template[1]
+
+        def render(self, data):
+            """Renders the template with data, a dict of samples."""
+            return ''.join(literal + (format(data[name], spec) if name else '')
+                           for literal, name, spec in self._get_template())
 
-            self.settings['custom_text'].format(**data)
-            return self.settings['custom_text'].format(**data)
+        def get_guide(self):
+            """Updates the label guide from appindicator. It is built from
+            the widest value each sensor can take, nothing is sampled."""
+            try:
+                return self.render(self._guide_samples(self.get_sensor_names()))
+            except (ValueError, TypeError):
+                return ''
+
+        def check_template(self, text):
+            """Raises an ISMError if a format spec of text does not suit its
+            sensor, by rendering text with the samples of the guide."""
+            parts = self.parse_template(text)
+            data = self._guide_samples(
+                [name for _literal, name, _spec in parts if name])
+            for _literal, name, spec in parts:
+                if not name:
+                    continue
+                try:
+                    format(data[name], spec)
+                except (ValueError, TypeError) as ex:
+                    raise ISMError(_("Invalid format for {{{}}}: {}").format(name, ex))
+
+        def _guide_samples(self, names):
+            data = {}
+            for name in names:
+                try:
+                    instance = self.get(name)
+                except ISMError:
+                    instance = None
+                sample = instance.guide(name) if instance else None
+                if sample is None:
+                    # custom sensors: as wide as their latest value
+                    latest = self._latest.get(name)
+                    sample = latest.widest() if latest is not None else Sample('')
+                data[name] = sample
+
+            return data
+
+        def preview(self, text):
+            """Renders text with the latest samples of the fetcher, without
+            sampling anything. The sensors missing from them are sampled
+            from the next tick on, meanwhile they are shown as '…'."""
+            parts = self.parse_template(text)
+            snapshot = self.get_snapshot(
+                [name for _literal, name, _spec in parts if name], remote=True,
+                asked=self._previewed)
+
+            return ''.join(literal + (format(snapshot[name], spec)
+                                      if name in snapshot else '…' if name else '')
+                           for literal, name, spec in parts)
 
         def get_label(self, data):
             """It updates the appindicator text with the the values
             from data"""
             try:
-                label = self.settings["custom_text"].format(**data) if len(data) \
+                label = self.render(data) if len(data) \
                     else _("(no output)")
 
             except KeyError as ex:
@@ -221,10 +587,103 @@ class SensorManager(object):
             return label
 
         def initiate_fetcher(self, parent):
-            self._fetcher = StatusFetcher(parent)
+            if self._fetcher is not None:
+                self._fetcher.stop()
+
+            if self.settings['sampler_process']:
+                self._fetcher = SamplerProcess(parent)
+            else:
+                self._fetcher = StatusFetcher(parent)
             self._fetcher.start()
             logging.info("Fetcher started")
 
+            if self.settings['snapshot_listen'] and self._server is None:
+                self.start_server(self.settings['snapshot_listen'])
+
+        def start_server(self, listen):
+            """Serves the snapshot of the sensors to other hosts."""
+            address, _sep, port = listen.rpartition(':')
+            try:
+                self._server = ThreadingHTTPServer(
+                    (address, int(port) if port else SensorManager.SNAPSHOT_PORT),
+                    SnapshotHandler)
+            except (OSError, ValueError) as ex:
+                logging.exception(ex)
+                logging.error(_("Serving the snapshot on {} failed").format(listen))
+                return
+
+            self._server.daemon_threads = True
+            Thread(target=self._server.serve_forever, daemon=True).start()
+            logging.info(_("Serving the snapshot on {}").format(listen))
+
+        def shutdown(self):
+            """Stops the fetcher and what runs besides it."""
+            if self._fetcher is not None:
+                self._fetcher.stop()
+                self._fetcher = None
+            self.stop_streams()
+            for sensor in self.sensor_instances:
+                if isinstance(sensor, PluginSensor):
+                    sensor.stop()
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                self._server = None
+
+        def set_latest(self, data):
+            """Keeps the samples of a tick which was not run by get_results,
+            i.e. by the sampler process."""
+            self._latest = data
+
+        def get_watched(self):
+            with self._watched_lock:
+                for name, asked in list(self._watched.items()):
+                    if time.time() - asked > SensorManager.WATCH_TIMEOUT:
+                        del self._watched[name]
+                return dict(self._watched)
+
+        def set_watched(self, watched):
+            with self._watched_lock:
+                self._watched = dict(watched)
+
+        def get_snapshot(self, names, remote=False, asked=None):
+            """Returns the latest samples of the given sensors. The ones
+            which are not sampled yet are sampled from the next tick on,
+            except the remote ones unless remote is set. The time each
+            sensor was asked for is also stored in asked, if given."""
+            latest = self._latest
+            snapshot = {}
+            for name in names:
+                if name in latest:
+                    snapshot[name] = latest[name]
+                # never forward the request of a host to another one
+                if name.startswith('remote//') and not remote:
+                    continue
+                try:
+                    self.validate(name)
+                except ISMError:
+                    continue
+                with self._watched_lock:
+                    if name not in self._watched and \
+                            len(self._watched) >= SensorManager.MAX_WATCHED:
+                        logging.warning(_("Too many sensors asked for, ignoring {}")
+                                        .format(name))
+                        continue
+                    self._watched[name] = time.time()
+                    if asked is not None:
+                        asked[name] = self._watched[name]
+
+            return snapshot
+
+        def stop_preview(self):
+            """Stops sampling the sensors only the preview asked for."""
+            with self._watched_lock:
+                for name, asked in self._previewed.items():
+                    # a remote host asked for it since
+                    if self._watched.get(name) == asked:
+                        del self._watched[name]
+                self._previewed = {}
+
         def fill_liststore(self, list_store):
 
             sensors = self.settings['sensors']
@@ -236,6 +695,16 @@ class SensorManager(object):
 
             return cmd
 
+        def is_persistent(self, name):
+            return name in self.settings["persistent"]
+
+        def _set_persistent(self, name, persistent):
+            names = self.settings["persistent"]
+            if persistent and name not in names:
+                names.append(name)
+            elif not persistent and name in names:
+                names.remove(name)
+
         def set_custom_text(self, custom_text):
             self.settings["custom_text"] = custom_text
 
@@ -252,26 +721,112 @@ class SensorManager(object):
             """Return a dict whose element are the sensors
             and their values"""
             res = {}
-            from preferences import Preferences
-
-            #print (self.settings["custom_text"]) custom_text is the full visible string seen in Preferences edit field
-            for sensor in Preferences.sensors_regex.findall(
-                    self.settings["custom_text"]):
-
-                sensor = sensor[1:-1]
 
-                instance = self.get(sensor)
+            self._poll_streams()
+
+            names = self.get_sensor_names()
+            with self._watched_lock:
+                for name, asked in list(self._watched.items()):
+                    if time.time() - asked > SensorManager.WATCH_TIMEOUT:
+                        del self._watched[name]
+                    elif name not in names:
+                        names.append(name)
+            # the rules check the samples of the tick, see StatusFetcher
+            for rule in self.settings['rules']:
+                name = rule.get('sensor') if isinstance(rule, dict) else None
+                if isinstance(name, str) and name not in names:
+                    try:
+                        self.validate(name)
+                    except ISMError:
+                        continue
+                    names.append(name)
+
+            # let each sensor read what all of its tokens need at once
+            owners = {}
+            instances = {}
+            for sensor in names:
+                try:
+                    instance = owners[sensor] = self.get(sensor)
+                except ISMError as ex:
+                    # e.g. a cgroup or mount point which went away
+                    logging.error(ex)
+                    res[sensor] = Sample(_("N/A"))
+                    continue
+                if instance:
+                    instances.setdefault(instance, []).append(sensor)
+            for instance, sensors in instances.items():
+                instance.prepare(sensors)
+            # let the sensors which are no longer used release what they hold
+            for instance in self._prepared:
+                if instance not in instances:
+                    instance.prepare([])
+            self._prepared = list(instances.keys())
+
+            for sensor in names:
+                if sensor not in owners:
+                    continue
+                instance = owners[sensor]
 
                 if instance:
                     value = instance.get_value(sensor)
-                    if value:
+                    if value is not None:
                         res[sensor] = value
 
+                elif not isinstance(
+                        self.settings["sensors"].get(sensor, (None, None))[1], str):
+                    # not a custom sensor, e.g. one of an uninstalled plugin
+                    res[sensor] = Sample(_("N/A"))
+
+                elif self.is_persistent(sensor):
+                    res[sensor] = Sample(self._read_stream(
+                        sensor, self.settings["sensors"][sensor][1]))
+
                 else:  # custom sensor
-                    res[sensor] = self._exec(self.settings["sensors"][sensor][1])
+                    res[sensor] = Sample(
+                        self._exec(self.settings["sensors"][sensor][1]))
+
+            # the persistent sensors which left the label
+            for name in list(self._streams.keys()):
+                if name not in names:
+                    self._stop_stream(name)
 
+            self._latest = res
             return res
 
+        def _poll_streams(self):
+            """Drains, without blocking, whatever the persistent sensors
+            wrote since the last tick."""
+            with self._streams_lock:
+                if not self._streams:
+                    return
+                for key, _mask in self._selector.select(0):
+                    key.data.on_readable()
+
+        def _read_stream(self, name, command):
+            """Returns the latest line written by a persistent sensor,
+            (re)starting its command when needed."""
+            with self._streams_lock:
+                stream = self._streams.get(name)
+                if stream is not None and stream.command != command:
+                    stream.stop()
+                    stream = None
+                if stream is None:
+                    stream = StreamingCommand(command, self._selector)
+                    self._streams[name] = stream
+
+                return stream.get_value()
+
+        def _stop_stream(self, name):
+            with self._streams_lock:
+                stream = self._streams.pop(name, None)
+                if stream is not None:
+                    stream.stop()
+
+        def stop_streams(self):
+            """Terminates the commands of all the persistent sensors."""
+            for name in list(self._streams.keys()):
+                self._stop_stream(name)
+
         def _exec(self, command):
             """Execute a custom command."""
             try:
@@ -302,10 +857,117 @@ class SensorManager(object):
         return setattr(self.__instance, attr, value)
 
 
+class StreamingCommand(object):
+    """A custom command which is started once and writes one value per
+    line to its stdout. Only the latest complete line is kept and the
+    command is restarted with an increasing delay whenever it exits."""
+
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 60
+
+    def __init__(self, command, selector):
+        self.command = command
+        self._selector = selector
+        self._process = None
+        self._buffer = b''
+        self._latest = None
+        self._backoff = self.MIN_BACKOFF
+        self._started_at = 0
+        self._restart_at = 0
+
+    def start(self):
+        try:
+            # in its own process group, so that the whole pipeline is stopped
+            self._process = subprocess.Popen(self.command, stdout=subprocess.PIPE,
+                                             shell=True, start_new_session=True)
+        except OSError:
+            logging.error(_("Error running: {}").format(self.command))
+            self._schedule_restart()
+            return
+
+        self._started_at = time.time()
+        os.set_blocking(self._process.stdout.fileno(), False)
+        self._selector.register(self._process.stdout, selectors.EVENT_READ, self)
+
+    def on_readable(self):
+        """Called when the selector reports pending output. Reads all of
+        it, so that a chatty command never gets blocked on a full pipe."""
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self._process.stdout.fileno(), 65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                chunk = b''
+
+            if not chunk:  # EOF, the command is gone
+                logging.warning(_("Persistent sensor exited: {}").format(self.command))
+                self._close()
+                self._schedule_restart()
+                return
+            chunks.append(chunk)
+
+        lines = (self._buffer + b''.join(chunks)).split(b'\n')
+        self._buffer = lines.pop()
+        for line in reversed(lines):
+            if line.strip():
+                self._latest = line.strip()
+                break
+
+    def get_value(self):
+        if self._process is None and time.time() >= self._restart_at:
+            self.start()
+
+        return self._latest.decode('utf-8') if self._latest else _("(no output)")
+
+    def stop(self):
+        self._close()
+
+    def _close(self):
+        if self._process is None:
+            return
+
+        self._selector.unregister(self._process.stdout)
+        self._process.stdout.close()
+        self._signal(signal.SIGTERM)
+        try:
+            self._process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self._signal(signal.SIGKILL)
+            self._process.wait()
+        self._process = None
+        self._buffer = b''
+
+    def _signal(self, signum):
+        """Signals every process of the command's group."""
+        try:
+            os.killpg(self._process.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _schedule_restart(self):
+        # a command which ran for a while gets restarted quickly again
+        if time.time() - self._started_at > self.MAX_BACKOFF:
+            self._backoff = self.MIN_BACKOFF
+
+        self._restart_at = time.time() + self._backoff
+        self._backoff = min(self._backoff * 2, self.MAX_BACKOFF)
+
+
 class BaseSensor(object):
     name = ''
     desc = ''
     cmd = True
+    # unit of the samples, it picks how they are rendered by default
+    unit = ''
+
+    COST_LOW = 'low'
+    COST_HIGH = 'high'
+    # used by plugins only: sensors with a high cost are refreshed in a
+    # background thread, and none is refreshed more than once per period
+    cost = COST_LOW
+    period = 0
 
     def check(self, sensor):
         '''
@@ -318,18 +980,263 @@ class BaseSensor(object):
         if sensor == self.name:
             return True
 
+    def prepare(self, sensors):
+        """Called once per tick, before get_value, with all the sensor
+        strings this sensor is going to be asked for."""
+        pass
+
     def get_value(self, sensor_data):
+        """Returns a Sample, or None if the sensor can not be read."""
+        return None
+
+    def guide(self, sensor):
+        """Returns a Sample as wide as the ones of the sensor can get once
+        rendered, without reading it, or None if that is not known."""
+        if self.unit in WIDEST_VALUES:
+            return Sample(WIDEST_VALUES[self.unit], self.unit)
+
         return None
 
+
+class PluginCall(Thread):
+    """Calls a plugin on a daemon thread of its own: a plugin which hangs
+    keeps that thread, but neither the tick nor the indicator's exit."""
+
+    def __init__(self, function, *args):
+        Thread.__init__(self, daemon=True)
+        self._function = function
+        self._args = args
+        self.result = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.result = self._function(*self._args)
+        except Exception as ex:
+            self.error = ex
+
+    def wait(self, timeout):
+        """Returns True if the call is over."""
+        self.join(timeout)
+        return not self.is_alive()
+
+
+class PluginSensor(BaseSensor):
+    """Wraps a sensor loaded from a plugin so that one which raises or
+    is slow can not break the tick: the plugin is only ever called from
+    a PluginCall, and waited for at most MAX_TICK_TIME."""
+
+    # a low cost plugin slower than this is moved out of the tick
+    MAX_TICK_TIME = 0.5
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.name = plugin.name
+        self.desc = plugin.desc
+        self.unit = plugin.unit
+        self._background = plugin.cost == BaseSensor.COST_HIGH
+        self._values = {}  # sensor => (value, time)
+        self._pending = set()
+        self._checks = {}  # sensor => PluginCall of the plugin's check
+        self._preparing = None
+        self._failing = set()  # what raised last time it was called
+        self._stopped = False
+        self._lock = Lock()
+
+    def stop(self):
+        """Calls the plugin no more, the calls still running are left
+        to their daemon threads."""
+        self._stopped = True
+
+    def check(self, sensor):
+        with self._lock:
+            call = self._checks.get(sensor)
+            started = call is None
+            if started:
+                call = self._checks[sensor] = PluginCall(self.plugin.check, sensor)
+
+        # a check which already timed out is not waited for again
+        if not call.wait(self.MAX_TICK_TIME if started else 0):
+            if started:
+                logging.warning(_("Plugin sensor {} is slow to check {}").format(
+                    self.name, sensor))
+            return None
+        if isinstance(call.error, ISMError):
+            # and checked again the next time, see SensorManager.validate
+            with self._lock:
+                self._checks.pop(sensor, None)
+            raise call.error
+        if call.error is not None:
+            self._report(('check', sensor), call.error)
+            return None
+
+        return call.result
+
+    def prepare(self, sensors):
+        with self._lock:
+            if self._stopped or \
+                    self._preparing is not None and self._preparing.is_alive():
+                return  # still stuck in a previous tick
+            self._preparing = PluginCall(self._prepare, sensors)
+
+        if not self._preparing.wait(self.MAX_TICK_TIME):
+            logging.warning(_("Plugin sensor {} is slow to prepare").format(self.name))
+
+    def _prepare(self, sensors):
+        try:
+            self.plugin.prepare(sensors)
+            self._recovered('prepare')
+        except Exception as ex:
+            self._report('prepare', ex)
+
+    def _report(self, key, ex):
+        """Logs an error of the plugin, but only the first time in a row
+        that the same call raises, not on every tick."""
+        with self._lock:
+            if key in self._failing:
+                return
+            self._failing.add(key)
+        logging.exception(ex)
+
+    def _recovered(self, key):
+        with self._lock:
+            self._failing.discard(key)
+
+    def guide(self, sensor):
+        try:
+            return self.plugin.guide(sensor)
+        except Exception as ex:
+            self._report(('guide', sensor), ex)
+            return None
+
+    def get_value(self, sensor):
+        with self._lock:
+            value, updated = self._values.get(sensor, (Sample(_("(no output)")), 0))
+            if self._stopped or sensor in self._pending or \
+                    time.time() - updated < self.plugin.period:
+                return value
+            self._pending.add(sensor)
+
+        call = PluginCall(self._refresh, sensor)
+        if self._background:
+            return value
+
+        if not call.wait(self.MAX_TICK_TIME):
+            logging.warning(_("Plugin sensor {} is slow, sampling it in the "
+                              "background").format(self.name))
+            self._background = True
+            return value
+
+        return call.result
+
+    def _refresh(self, sensor):
+        try:
+            value = self.plugin.get_value(sensor)
+            if not isinstance(value, Sample):
+                value = Sample(value if value is not None else _("(no output)"),
+                               self.unit)
+            self._recovered(('get_value', sensor))
+        except Exception as ex:
+            self._report(('get_value', sensor), ex)
+            value = Sample(_("Error"))
+
+        with self._lock:
+            self._values[sensor] = (value, time.time())
+            self._pending.discard(sensor)
+
+        return value
+
+
+class CoresSample(Sample):
+    """A CPU sample which also holds the usage of each core, summed up by
+    the template: {cpu:max}, {cpu:min}, {cpu:spread} (max - min),
+    {cpu:top4} (the 4 busiest cores) and {cpu:heat}, one block character
+    per core. A format spec can follow, as in {cpu:max:3.0f}."""
+    __slots__ = ('cores', 'default')
+
+    HEAT_BLOCKS = ' ▁▂▃▄▅▆▇█'
+    top = re.compile(r"\Atop(\d+)\Z")
+
+    def __init__(self, value, cores, default='', timestamp=None):
+        Sample.__init__(self, value, '%', timestamp)
+        self.cores = cores
+        self.default = default
+
+    def _format(self, spec):
+        summary, _sep, spec = (spec or self.default).partition(':')
+        if summary == 'heat':
+            return self.heat()
+        if summary in ('max', 'min', 'spread'):
+            return Sample._format(Sample(getattr(self, summary)(), self.unit), spec)
+        if self.top.match(summary):
+            return ' '.join(Sample._format(Sample(value, self.unit), spec) for value
+                            in self.busiest(int(summary[3:])))
+
+        return Sample._format(self, summary)
+
+    def to_dict(self):
+        data = Sample.to_dict(self)
+        data['cores'] = [float(usage) for usage in self.cores]
+        data['default'] = self.default
+        return data
+
+    def max(self):
+        return float(self.cores.max() if np is not None else max(self.cores))
+
+    def min(self):
+        return float(self.cores.min() if np is not None else min(self.cores))
+
+    def spread(self):
+        return self.max() - self.min()
+
+    def busiest(self, count):
+        if np is not None:
+            return np.sort(self.cores)[::-1][:count].tolist()
+
+        return sorted(self.cores, reverse=True)[:count]
+
+    def heat(self):
+        if np is not None:
+            levels = np.clip(np.rint(self.cores * 0.08), 0, 8).astype(int)
+            return ''.join(np.array(list(self.HEAT_BLOCKS))[levels])
+
+        return ''.join(self.HEAT_BLOCKS[min(8, max(0, int(round(usage * 0.08))))]
+                       for usage in self.cores)
+
+    def widest(self):
+        cores = [100] * len(self.cores)
+        if np is not None:
+            cores = np.array(cores, dtype=float)
+        return WidestCoresSample(100, cores, self.default, self.timestamp)
+
+
+class WidestCoresSample(CoresSample):
+    """As wide as a CoresSample can get once rendered: all its cores are
+    busy, but the spread is that of one idle core among them."""
+    __slots__ = ()
+
+    def spread(self):
+        return 100.0 if len(self.cores) > 1 else 0.0
+
+
 class CPUSensor(BaseSensor):
-    name = 'cpu\d*'
-    desc = _('Average CPU usage')
-    cpus = re.compile("\Acpu\d*\Z")
+    """The usage of the CPUs, as the share of time spent in user and
+    system mode. One snapshot of all the cores is taken per tick, from
+    which every cpu token is computed."""
+    name = r'cpu(\d*|s)'
+    desc = _('Average CPU usage, per core with cpuN or cpus')
+    unit = '%'
+    cpus = re.compile(r"\Acpu(\d*|s)\Z")
     last = None
 
+    def __init__(self):
+        self._cores = []
+        self._average = 0
+
     def check(self, sensor):
         if self.cpus.match(sensor):
-            if len(sensor) == 3:
+            if len(sensor) == 3 or sensor == 'cpus':
                 nber = 0
             else:
                 nber = int(sensor[3:]) if len(sensor) > 3 else 999
@@ -342,49 +1249,69 @@ class CPUSensor(BaseSensor):
 
             return True
 
+    def prepare(self, sensors):
+        if sensors:
+            self._fetch_cores()
+
+    def guide(self, sensor):
+        if sensor in ('cpu', 'cpus'):
+            return CoresSample(0, [0] * ps.NUM_CPUS,
+                               'heat' if sensor == 'cpus' else '').widest()
+
+        return BaseSensor.guide(self, sensor)
+
     def get_value(self, sensor):
         if sensor == 'cpu':
-            return "{:02.0f}%".format(self._fetch_cpu())
+            return CoresSample(self._average, self._cores)
+        elif sensor == 'cpus':
+            sample = CoresSample(0, self._cores, 'heat')
+            sample.value = sample.max()
+            return sample
         elif CPUSensor.cpus.match(sensor):
-            cpus = self._fetch_cpu(percpu=True)
-            return "{:02.0f}%".format(cpus[int(sensor[3:])])
+            return Sample(float(self._cores[int(sensor[3:])]), self.unit)
 
         return None
 
-    def _fetch_cpu(self, percpu=False):
-        if percpu:
-            return ps.cpu_percent(interval=0, percpu=True)
-
-        last = self.last
-        current = ps.cpu_times()
-        if not last:
-            last = current
-
-        total_time_passed = sum(
-            [v - last.__dict__[k]
-             if not isinstance(v, list)
-             else 0
-             for k, v in current.__dict__.items()])
-
-        sys_time = current.system - last.system
-        usr_time = current.user - last.user
+    def _fetch_cores(self):
+        """Computes the usage of each core since the previous tick, with
+        array math rather than per token calls."""
+        current = ps.cpu_times(percpu=True)
+        fields = current[0]._fields
+        user, system = fields.index('user'), fields.index('system')
+
+        if np is not None:
+            current = np.array(current, dtype=float)
+            last = self.last if self.last is not None \
+                and self.last.shape == current.shape else current
+            deltas = current - last
+            total = deltas.sum(axis=1)
+            busy = deltas[:, user] + deltas[:, system]
+            self._cores = np.divide(100 * busy, total, out=np.zeros_like(total),
+                                    where=total > 0)
+            total, busy = total.sum(), busy.sum()
+        else:
+            current = [tuple(core) for core in current]
+            last = self.last if self.last is not None \
+                and len(self.last) == len(current) else current
+            deltas = [[now - before for now, before in zip(core, last_core)]
+                      for core, last_core in zip(current, last)]
+            totals = [sum(delta) for delta in deltas]
+            busies = [delta[user] + delta[system] for delta in deltas]
+            self._cores = [100 * b / t if t > 0 else 0
+                           for b, t in zip(busies, totals)]
+            total, busy = sum(totals), sum(busies)
 
         self.last = current
-
-        if total_time_passed > 0:
-            sys_percent = 100 * sys_time / total_time_passed
-            usr_percent = 100 * usr_time / total_time_passed
-            return sys_percent + usr_percent
-        else:
-            return 0
+        self._average = float(100 * busy / total) if total > 0 else 0
 
 
 class MemSensor(BaseSensor):
     name = 'mem'
     desc = _('Physical memory in use.')
+    unit = '%'
 
     def get_value(self, sensor_data):
-       return '{:02.0f}%'.format(self._fetch_mem())
+        return Sample(self._fetch_mem(), self.unit)
 
     def _fetch_mem(self):
         """It gets the total memory info and return the used in percent."""
@@ -401,31 +1328,38 @@ class MemSensor(BaseSensor):
 class NetSensor(BaseSensor):
     name = 'net'
     desc = _('Network activity.')
-    _last_net_usage = [0, 0]  # (up, down)
+    unit = 'B/s'
+    _last_net_usage = [0, 0]  # (down, up)
+    _last_time = None
 
     def get_value(self, sensor_data):
-        return self._fetch_net()
+        return Sample(self._fetch_net(), self.unit)
+
+    def guide(self, sensor):
+        return Sample((WIDEST_VALUES[self.unit],) * 2, self.unit)
 
     def _fetch_net(self):
-        """It returns the bytes sent and received in bytes/second"""
+        """It returns the bytes received and sent in bytes/second"""
         current = [0, 0]
         for _, iostat in list(ps.network_io_counters(pernic=True).items()):
             current[0] += iostat.bytes_recv
             current[1] += iostat.bytes_sent
         dummy = copy.deepcopy(current)
+        now = time.time()
 
         current[0] -= self._last_net_usage[0]
         current[1] -= self._last_net_usage[1]
         self._last_net_usage = dummy
-        mgr = SensorManager()
-        current[0] /= mgr.get_interval()
-        current[1] /= mgr.get_interval()
-        return '↓{}/s ↑{}/s'.format(bytes_to_human(current[0]),
-                                    bytes_to_human(current[1]))
+        # the fetcher does not always sleep for exactly one interval
+        elapsed = now - self._last_time if self._last_time \
+            else SensorManager().get_interval()
+        self._last_time = now
+        return (current[0] / elapsed, current[1] / elapsed)
 
 class BatSensor(BaseSensor):
     name = 'bat\d*'
     desc = _('Battery capacity.')
+    unit = '%'
     bat = re.compile("\Abat\d*\Z")
 
     def check(self, sensor):
@@ -437,7 +1371,7 @@ class BatSensor(BaseSensor):
     def get_value(self, sensor):
         if BatSensor.bat.match(sensor):
             bat_id = int(sensor[3:]) if len(sensor) > 3 else 0
-            return '{:02.0f}%'.format(self._fetch_bat(bat_id))
+            return Sample(self._fetch_bat(bat_id), self.unit)
 
         return None
 
@@ -460,6 +1394,7 @@ class BatSensor(BaseSensor):
 class FSSensor(BaseSensor):
     name = 'fs//.+'
     desc = _('Available space in file system.')
+    unit = 'B'
 
     def check(self, sensor):
         if sensor.startswith("fs//"):
@@ -472,32 +1407,27 @@ class FSSensor(BaseSensor):
     def get_value(self, sensor):
         if sensor.startswith('fs//'):
             parts = sensor.split('//')
-            return self._fetch_fs(parts[1])
+            bytes_ = self._fetch_fs(parts[1])
+            return Sample(bytes_, self.unit) if bytes_ is not None else None
 
         return None
 
     def _fetch_fs(self, mount_point):
-        """It returns the amount of bytes available in the fs in
-        a human-readble format."""
+        """It returns the amount of bytes available in the fs."""
         if not os.access(mount_point, os.F_OK):
             return None
 
         stat = os.statvfs(mount_point)
-        bytes_ = stat.f_bavail * stat.f_frsize
-
-        for unit in B_UNITS:
-            if bytes_ < 1024:
-                return "{} {}".format(round(bytes_,2), unit)
-            bytes_ /= 1024
-
+        return stat.f_bavail * stat.f_frsize
 
 
 class SwapSensor(BaseSensor):
     name = 'swap'
     desc = _("Average swap usage")
+    unit = '%'
 
     def get_value(self, sensor):
-        return '{:02.0f}%'.format(self._fetch_swap())
+        return Sample(self._fetch_swap(), self.unit)
 
     def _fetch_swap(self):
         """Return the swap usage in percent"""
@@ -519,6 +1449,466 @@ class SwapSensor(BaseSensor):
         except IOError:
             return "N/A"
 
+class OpenFiles(object):
+    """Files of /proc or /sys which are read again on every tick. They are
+    kept open and read from their start, which is much cheaper than
+    opening them each time."""
+
+    def __init__(self):
+        self._files = {}  # path => open file
+        self._used = set()  # paths read since the last close_unused
+
+    def read(self, path):
+        """Returns the content of the file or None if it can't be read,
+        e.g. when the cgroup is gone."""
+        self._used.add(path)
+        try:
+            f = self._files.get(path)
+            if f is None:
+                f = self._files[path] = open(path)
+            f.seek(0)
+            return f.read()
+        except (IOError, ValueError):
+            f = self._files.pop(path, None)
+            if f is not None:
+                f.close()
+            return None
+
+    def close_unused(self):
+        """Closes the files which were not read since the last call."""
+        for path in list(self._files.keys()):
+            if path not in self._used:
+                self._files.pop(path).close()
+        self._used = set()
+
+
+class CGroupSensor(BaseSensor):
+    """Resources used by a cgroup v2: cg//system.slice/foo.service/cpu is
+    the CPU used by the service (100% is one CPU), /mem its memory and
+    /io its disk throughput. The files are kept open and each one is read
+    once per tick whatever the number of tokens using it."""
+    name = 'cg//.+'
+    desc = _('Usage of a control group: cg//path/cpu, mem or io.')
+    cgroup = re.compile(r"\Acg//(.+)/(cpu|mem|io)\Z")
+    CGROUP_ROOT = '/sys/fs/cgroup'
+    FILES = {'cpu': 'cpu.stat', 'mem': 'memory.current', 'io': 'io.stat'}
+    UNITS = {'cpu': '%', 'mem': 'B', 'io': 'B/s'}
+
+    def __init__(self):
+        self._files = OpenFiles()
+        self._last = {}  # (cgroup, resource) => (counter, time)
+        self._samples = {}  # sensor => Sample, for the current tick
+
+    def check(self, sensor):
+        if sensor.startswith('cg//'):
+            match = self.cgroup.match(sensor)
+            if not match:
+                raise ISMError(_("cgroup sensors are written cg//path/cpu, mem or io."))
+            if not os.path.isdir(self._path(match.group(1))):
+                raise ISMError(_("cgroup: {} doesn't exists.").format(match.group(1)))
+
+            return True
+
+    def prepare(self, sensors):
+        self._samples = {}
+        now = time.time()
+        for sensor in sensors:
+            cgroup, resource = self.cgroup.match(sensor).groups()
+            content = self._files.read(os.path.join(self._path(cgroup),
+                                                    self.FILES[resource]))
+            if content is None:
+                self._last.pop((cgroup, resource), None)
+                continue
+
+            if resource == 'mem':
+                value = int(content)
+            else:
+                counter = self._parse_cpu(content) if resource == 'cpu' \
+                    else self._parse_io(content)
+                last_counter, last_time = self._last.get((cgroup, resource),
+                                                         (counter, now))
+                self._last[(cgroup, resource)] = (counter, now)
+                elapsed = now - last_time
+                value = (counter - last_counter) / elapsed if elapsed > 0 else 0
+                if resource == 'cpu':  # usec per second to percent
+                    value /= 10000
+
+            self._samples[sensor] = Sample(value, self.UNITS[resource], now)
+
+        # cgroups which are not shown anymore
+        self._files.close_unused()
+        for key in list(self._last.keys()):
+            if 'cg//{}/{}'.format(*key) not in sensors:
+                del self._last[key]
+
+    def get_value(self, sensor):
+        return self._samples.get(sensor, Sample(_("N/A")))
+
+    def guide(self, sensor):
+        unit = self.UNITS[self.cgroup.match(sensor).group(2)]
+        return Sample(WIDEST_VALUES[unit], unit)
+
+    def _path(self, cgroup):
+        return os.path.join(self.CGROUP_ROOT, cgroup.strip('/'))
+
+    @staticmethod
+    def _parse_cpu(content):
+        for line in content.splitlines():
+            key, value = line.split()
+            if key == 'usage_usec':
+                return int(value)
+
+        return 0
+
+    @staticmethod
+    def _parse_io(content):
+        """Bytes read and written by all the devices."""
+        total = 0
+        for line in content.splitlines():
+            for field in line.split()[1:]:
+                key, _sep, value = field.partition('=')
+                if key in ('rbytes', 'wbytes'):
+                    total += int(value)
+
+        return total
+
+
+class PSISensor(BaseSensor):
+    """Pressure stall information: the share of time some (or all, with
+    full) tasks were waiting for the CPU, memory or I/O. psi//cpu is the
+    10s average of some, psi//mem/full/avg60 or psi//io/some/total can be
+    asked for too, total being computed from the counter since the
+    previous tick."""
+    name = 'psi//.+'
+    desc = _('Pressure stall: psi//cpu, mem or io[/some|full][/avg10|avg60|avg300|total].')
+    unit = '%'
+    psi = re.compile(r"\Apsi//(cpu|mem|io)(?:/(some|full))?(?:/(avg10|avg60|avg300|total))?\Z")
+    PRESSURE_DIR = '/proc/pressure'
+    FILES = {'cpu': 'cpu', 'mem': 'memory', 'io': 'io'}
+
+    def __init__(self):
+        self._files = OpenFiles()
+        self._last = {}  # (resource, kind) => (total, time)
+        self._samples = {}  # sensor => Sample, for the current tick
+
+    def check(self, sensor):
+        if sensor.startswith('psi//'):
+            match = self.psi.match(sensor)
+            if not match:
+                raise ISMError(_("Pressure sensors are written psi//cpu, mem or io "
+                                 "optionally followed by /some or /full and "
+                                 "/avg10, /avg60, /avg300 or /total."))
+            if not os.path.exists(self._path(match.group(1))):
+                raise ISMError(_("Pressure stall information is not available."))
+
+            return True
+
+    def prepare(self, sensors):
+        self._samples = {}
+        now = time.time()
+        pressures = {}  # each file is read once even if used by many tokens
+        rates = {}  # (resource, kind) => rate of the total counter
+        for sensor in sensors:
+            resource, kind, field = self.psi.match(sensor).groups()
+            kind = kind or 'some'
+            field = field or 'avg10'
+
+            if resource not in pressures:
+                pressures[resource] = self._read(resource)
+            values = pressures[resource].get(kind)
+            if values is None:
+                continue
+
+            if field != 'total':
+                value = values[field]
+            else:
+                # shared by the tokens differing only by their defaults
+                if (resource, kind) not in rates:
+                    rates[(resource, kind)] = self._rate(resource, kind,
+                                                         values['total'], now)
+                value = rates[(resource, kind)]
+
+            self._samples[sensor] = Sample(value, self.unit, now)
+
+        # totals which are not shown anymore
+        self._files.close_unused()
+        for key in list(self._last.keys()):
+            if key not in rates:
+                del self._last[key]
+
+    def get_value(self, sensor):
+        return self._samples.get(sensor, Sample(_("N/A")))
+
+    def _rate(self, resource, kind, total, now):
+        """Percent of the time stalled since the previous tick."""
+        last_total, last_time = self._last.get((resource, kind), (total, now))
+        self._last[(resource, kind)] = (total, now)
+        elapsed = now - last_time
+        # usec stalled per second to percent
+        return (total - last_total) / elapsed / 10000 if elapsed > 0 else 0
+
+    def _path(self, resource):
+        return os.path.join(self.PRESSURE_DIR, self.FILES[resource])
+
+    def _read(self, resource):
+        """Returns {'some': {'avg10': .., 'total': ..}, 'full': {..}}"""
+        content = self._files.read(self._path(resource)) or ''
+        pressure = {}
+        for line in content.splitlines():
+            kind, *fields = line.split()
+            pressure[kind] = {}
+            for field in fields:
+                key, _sep, value = field.partition('=')
+                pressure[kind][key] = int(value) if key == 'total' else float(value)
+
+        return pressure
+
+
+class RemoteSensor(BaseSensor):
+    """Reads sensors from the snapshot served by indicator-sysmonitor on
+    another host. All the hosts are fetched concurrently once per tick,
+    through kept-alive connections."""
+    name = 'remote//.+'
+    desc = _('Sensor of another host: remote//host/sensor.')
+    remote = re.compile(r"\Aremote//([^/]+)/(.+)\Z")
+    TIMEOUT = 1
+
+    def __init__(self):
+        self._samples = {}  # sensor => Sample
+        self._fresh = set()  # the sensors refreshed during this tick
+        self._tick = 0
+        self._idle = {}  # address => [HTTPConnection]
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=8)
+
+    def check(self, sensor):
+        if sensor.startswith('remote//'):
+            if not self.remote.match(sensor):
+                raise ISMError(_("Remote sensors are written remote//host/sensor."))
+
+            return True
+
+    def prepare(self, sensors):
+        hosts = {}
+        for sensor in sensors:
+            host, name = self.remote.match(sensor).groups()
+            hosts.setdefault(host, []).append(name)
+
+        with self._lock:
+            self._fresh = set()
+            self._tick += 1
+            tick = self._tick
+        # a host slower than that keeps its previous values, marked stale
+        wait([self._executor.submit(self._fetch, host, names, tick)
+              for host, names in hosts.items()], timeout=self.TIMEOUT)
+
+    def get_value(self, sensor):
+        with self._lock:
+            sample = self._samples.get(sensor)
+            if sample is None:
+                return Sample(_("N/A"))
+
+            sample.stale = sensor not in self._fresh
+            return sample
+
+    def guide(self, sensor):
+        with self._lock:
+            sample = self._samples.get(sensor)
+
+        return sample.widest() if sample is not None else None
+
+    def _fetch(self, host, names, tick):
+        try:
+            snapshot = self._request(host, names)
+        except (OSError, ValueError, http.client.HTTPException) as ex:
+            logging.warning(_("Fetching the snapshot of {} failed: {}").format(host, ex))
+            return
+
+        with self._lock:
+            if tick != self._tick:  # finished after its tick timed out
+                return
+            for name, data in snapshot.items():
+                sensor = 'remote//{}/{}'.format(host, name)
+                self._samples[sensor] = Sample.from_dict(data)
+                self._fresh.add(sensor)
+
+    def _request(self, host, names):
+        address = SensorManager().settings['remotes'].get(host, host)
+        path = '/snapshot?' + urllib.parse.urlencode(
+            [('sensor', name) for name in names])
+
+        connection = self._take_connection(address)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+        except (OSError, http.client.HTTPException):
+            # the host may have closed an idle connection, retry once
+            connection.close()
+            connection = self._connect(address)
+            connection.request('GET', path)
+            response = connection.getresponse()
+
+        body = response.read()
+        if response.status != 200:
+            connection.close()
+            raise ValueError(_("HTTP status {}").format(response.status))
+
+        with self._lock:
+            self._idle.setdefault(address, []).append(connection)
+
+        return json.loads(body.decode('utf-8'))
+
+    def _take_connection(self, address):
+        with self._lock:
+            idle = self._idle.get(address)
+            if idle:
+                return idle.pop()
+
+        return self._connect(address)
+
+    def _connect(self, address):
+        port = None if ':' in address else SensorManager.SNAPSHOT_PORT
+        return http.client.HTTPConnection(address, port, timeout=self.TIMEOUT)
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    """Answers GET /snapshot?sensor=cpu&sensor=mem with the latest
+    samples of these sensors as json."""
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body go in two writes, which Nagle's algorithm
+    # would hold back on kept-alive connections until the client ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/snapshot':
+            self.send_error(404)
+            return
+
+        names = urllib.parse.parse_qs(url.query).get('sensor', [])
+        snapshot = SensorManager().get_snapshot(names)
+        body = json.dumps({name: sample.to_dict()
+                           for name, sample in snapshot.items()}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format_, *args):
+        logging.debug(format_ % args)
+
+
+class ThresholdRule(object):
+    """Trips when a sensor stays above a value for a number of ticks. It
+    is armed again only once the value went back under below, which
+    defaults to above."""
+
+    def __init__(self, sensor, above, ticks=1, below=None):
+        """Raises a ValueError or a TypeError if the rule is invalid."""
+        if not isinstance(sensor, str):
+            raise TypeError(_("The sensor of a rule must be a string."))
+        self.sensor = sensor
+        self.above = float(above)
+        self.ticks = int(ticks)
+        self.below = self.above if below is None else float(below)
+        self._count = 0
+        self._armed = True
+
+    def __str__(self):
+        return '{} > {} for {} ticks'.format(self.sensor, self.above, self.ticks)
+
+    def update(self, data):
+        """Checks the samples of a tick, returns True when the rule trips."""
+        sample = data.get(self.sensor)
+        if sample is None:
+            return False
+        try:
+            value = max(sample.value) if isinstance(sample.value, tuple) \
+                else float(sample.value)
+        except (TypeError, ValueError):
+            return False
+
+        if not self._armed:
+            if value < self.below:
+                self._armed = True
+            return False
+
+        self._count = self._count + 1 if value > self.above else 0
+        if self._count >= self.ticks:
+            self._count = 0
+            self._armed = False
+            return True
+
+        return False
+
+
+class Capture(object):
+    """Saves the samples of a burst, as json lines, to a file. The
+    busiest processes are saved once a short while has passed, so that
+    they are ranked by the CPU they used since the rule tripped."""
+
+    # the processes are ranked on the first tick at least that much later
+    PROCESS_INTERVAL = 0.1
+
+    def __init__(self, rule, duration, processes=False):
+        if not os.path.isdir(SensorManager.CAPTURE_DIR):
+            os.makedirs(SensorManager.CAPTURE_DIR)
+
+        self.path = os.path.join(SensorManager.CAPTURE_DIR, time.strftime(
+            'capture-%Y%m%d-%H%M%S.jsonl'))
+        self.end = time.time() + duration
+        self._file = open(self.path, 'w')
+        self._write({'time': time.time(), 'rule': str(rule)})
+        self._processes = self._prime_processes() if processes else None
+        self._primed_at = time.time()
+
+    def add(self, data):
+        if self._processes is not None and \
+                time.time() - self._primed_at >= self.PROCESS_INTERVAL:
+            self._write_processes()
+        self._write({'time': time.time(),
+                     'samples': {name: sample.to_dict()
+                                 for name, sample in data.items()}})
+
+    def close(self):
+        if self._processes is not None:
+            self._write_processes()
+        self._file.close()
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+
+    @staticmethod
+    def _prime_processes():
+        """Starts measuring the CPU used by every process."""
+        processes = []
+        for process in ps.process_iter():
+            try:
+                process.cpu_percent(interval=None)
+                processes.append(process)
+            except ps.Error:
+                pass
+
+        return processes
+
+    def _write_processes(self, count=20):
+        """Saves the processes which used the most CPU since priming."""
+        processes = []
+        for process in self._processes:
+            try:
+                info = process.as_dict(attrs=['pid', 'name', 'memory_percent'])
+                info['cpu_percent'] = process.cpu_percent(interval=None)
+                processes.append(info)
+            except ps.Error:
+                pass
+
+        processes.sort(key=lambda p: p['cpu_percent'], reverse=True)
+        self._write({'time': time.time(), 'processes': processes[:count]})
+        self._processes = None
+
+
 class StatusFetcher(Thread):
     """It recollects the info about the sensors."""
 
@@ -526,14 +1916,259 @@ class StatusFetcher(Thread):
         Thread.__init__(self)
         self._parent = parent
         self.mgr = SensorManager()
+        self._rules = []
+        for rule in self.mgr.settings['rules']:
+            try:
+                self._rules.append(ThresholdRule(**rule))
+            except (TypeError, ValueError):
+                logging.error(_("Invalid rule: {}").format(rule))
+        self._capture = None
+        self._stopped = Event()
 
     def fetch(self):
         return self.mgr.get_results()
 
+    def stop(self):
+        self._stopped.set()
 
     def run(self):
         """It is the main loop."""
-        while self._parent.alive.isSet():
+        while self._parent.alive.isSet() and not self._stopped.is_set():
             data = self.fetch()
             self._parent.update(data)
-            time.sleep(self.mgr.get_interval())
+            self._check_rules(data)
+            if self._capture is not None:
+                self._stopped.wait(self.mgr.settings['burst_interval'])
+            else:
+                self._stopped.wait(self.mgr.get_interval())
+
+    def _check_rules(self, data):
+        """Starts, feeds and ends the burst captures, from the samples
+        which were already fetched."""
+        tripped = [rule for rule in self._rules if rule.update(data)]
+
+        if self._capture is None and tripped:
+            try:
+                self._capture = Capture(tripped[0],
+                                        self.mgr.settings['burst_duration'],
+                                        self.mgr.settings['capture_processes'])
+                logging.info(_("{} tripped, capturing to {}").format(
+                    tripped[0], self._capture.path))
+            except IOError as ex:
+                logging.exception(ex)
+
+        if self._capture is not None:
+            self._capture.add(data)
+            if time.time() >= self._capture.end:
+                self._capture.close()
+                self._capture = None
+
+
+class SharedSnapshot(object):
+    """The samples of the latest tick, in a fixed layout block of shared
+    memory: a sequence number, odd while the block is being written, the
+    length of the payload then the payload, json encoded. Readers never
+    lock, they read again when the sequence changed under them."""
+    SIZE = 64 * 1024
+    SEQUENCE = struct.Struct('=Q')
+    LENGTH = struct.Struct('=I')
+    HEADER_SIZE = SEQUENCE.size + LENGTH.size
+
+    def __init__(self, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.SIZE)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self._last_read = 0
+
+    def write(self, data):
+        payload = json.dumps({name: sample.to_dict()
+                              for name, sample in data.items()}).encode('utf-8')
+        if len(payload) > self.SIZE - self.HEADER_SIZE:
+            logging.error(_("Samples too large for the shared memory"))
+            return
+
+        buf = self.shm.buf
+        # a worker killed mid-write leaves an odd sequence behind
+        sequence = (self.SEQUENCE.unpack_from(buf)[0] + 1) & ~1
+        self.SEQUENCE.pack_into(buf, 0, sequence + 1)
+        self.LENGTH.pack_into(buf, self.SEQUENCE.size, len(payload))
+        buf[self.HEADER_SIZE:self.HEADER_SIZE + len(payload)] = payload
+        self.SEQUENCE.pack_into(buf, 0, sequence + 2)
+
+    def read(self):
+        """Returns the latest samples, or None if there is nothing new."""
+        buf = self.shm.buf
+        for _attempt in range(100):
+            sequence = self.SEQUENCE.unpack_from(buf)[0]
+            if sequence & 1:  # being written
+                time.sleep(0.001)
+                continue
+            if sequence == self._last_read:
+                return None
+
+            length = self.LENGTH.unpack_from(buf, self.SEQUENCE.size)[0]
+            payload = bytes(buf[self.HEADER_SIZE:self.HEADER_SIZE + length])
+            if self.SEQUENCE.unpack_from(buf)[0] != sequence:
+                continue
+
+            self._last_read = sequence
+            return {name: Sample.from_dict(data)
+                    for name, data in json.loads(payload.decode('utf-8')).items()}
+
+        return None
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SamplerWorker(object):
+    """Stands for the indicator in the sampler process: StatusFetcher
+    runs there unchanged and its updates go to the shared memory."""
+
+    def __init__(self, shm_name, connection):
+        self.alive = Event()
+        self.alive.set()
+        self.mgr = SensorManager()
+        self._snapshot = SharedSnapshot(shm_name)
+        self._connection = connection
+        self._ppid = os.getppid()
+
+    def apply(self, state):
+        """Takes the settings, and the sensors asked for by the snapshot
+        server or the preview, of the indicator process, when they changed.
+        The sensors asked for expire here as they do there."""
+        if 'settings' in state:
+            self.mgr.settings.update(state['settings'])
+            self.mgr.update_regex()
+        if 'watched' in state:
+            self.mgr.set_watched(state['watched'])
+
+    def update(self, data):
+        while self._connection.poll():
+            self.apply(self._connection.recv())
+        if os.getppid() != self._ppid:  # the indicator is gone
+            self.alive.clear()
+            return
+
+        self._snapshot.write(data)
+
+
+def _run_sampler(shm_name, state, connection):
+    """Entry point of the sampler process."""
+    logging.basicConfig(level=logging.INFO)
+    worker = SamplerWorker(shm_name, connection)
+    worker.apply(state)
+    StatusFetcher(worker).run()
+    worker.mgr.stop_streams()
+
+
+class SamplerProcess(Thread):
+    """Runs the sampling in a separate process so that a slow tick never
+    stalls the indicator, which only renders the samples published in
+    shared memory. The process is restarted when it dies."""
+
+    POLL_INTERVAL = 0.1
+    MAX_BACKOFF = 60
+
+    def __init__(self, parent):
+        Thread.__init__(self, daemon=True)
+        self._parent = parent
+        self.mgr = SensorManager()
+        self._context = multiprocessing.get_context('spawn')
+        self._snapshot = None
+        self._process = None
+        self._connection = None
+        self._settings = None  # the settings the process has, json encoded
+        self._watched = {}  # the sensors asked for the process has
+        self._backoff = 1
+        self._started_at = 0
+        self._restart_at = 0
+        self._stopped = Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        self._snapshot = SharedSnapshot()
+        try:
+            while self._parent.alive.isSet() and not self._stopped.is_set():
+                self._supervise()
+                data = self._snapshot.read()
+                if data is not None:
+                    self.mgr.set_latest(data)
+                    self._parent.update(data)
+                self._stopped.wait(self.POLL_INTERVAL)
+        finally:
+            self._stop_process()
+            self._snapshot.close(unlink=True)
+
+    def _supervise(self):
+        """(Re)starts the process and sends it the changed settings."""
+        if self._process is not None and not self._process.is_alive():
+            logging.error(_("Sampler process died, exit code {}").format(
+                self._process.exitcode))
+            self._stop_process()
+            if time.time() - self._started_at > self.MAX_BACKOFF:
+                self._backoff = 1
+            self._restart_at = time.time() + self._backoff
+            self._backoff = min(self._backoff * 2, self.MAX_BACKOFF)
+
+        settings = json.dumps(self.mgr.settings, sort_keys=True)
+        watched = self.mgr.get_watched()
+        if self._process is None:
+            if time.time() >= self._restart_at:
+                self._start_process(settings, watched)
+            return
+
+        state = {}
+        if settings != self._settings:
+            state['settings'] = self.mgr.settings
+        if self._watched_changed(watched):
+            state['watched'] = watched
+        if not state:
+            return
+        try:
+            self._connection.send(state)
+        except OSError as ex:
+            # the process died since, it is restarted on the next pass
+            logging.warning(_("Sampler process unreachable: {}").format(ex))
+            return
+        self._settings = settings
+        if 'watched' in state:
+            self._watched = watched
+
+    def _watched_changed(self, watched):
+        """True when other sensors are asked for, or when the ones asked
+        for again would expire in the process if not sent again."""
+        if watched.keys() != self._watched.keys():
+            return True
+
+        return any(asked - self._watched[name] > SensorManager.WATCH_TIMEOUT / 2
+                   for name, asked in watched.items())
+
+    def _start_process(self, settings, watched):
+        self._connection, child_connection = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_run_sampler,
+            args=(self._snapshot.name, {'settings': self.mgr.settings, 'watched': watched},
+                  child_connection),
+            daemon=True)
+        self._process.start()
+        self._started_at = time.time()
+        self._settings = settings
+        self._watched = watched
+        logging.info(_("Sampler process started, pid {}").format(self._process.pid))
+
+    def _stop_process(self):
+        if self._process is None:
+            return
+
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join(1)
+        self._connection.close()
+        self._process = None